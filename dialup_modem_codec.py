@@ -4,9 +4,94 @@ import struct
 import os
 import sys
 from scipy.io.wavfile import write, read
-from scipy.signal import hilbert, find_peaks
+
+def _reference_rate(samples_per_bit, sample_rate):
+  """
+  Частота дискретизации эталонного тона: шаг времени как у np.linspace(0, N / sample_rate, N),
+  которым всегда пользовался кодек. Кодер синтезирует тоны с этим шагом, декодер
+  ищет их с тем же шагом - поэтому читаются и файлы прежних версий
+  """
+  return sample_rate * (samples_per_bit - 1) / samples_per_bit
+
+try:
+  import numba
+except ImportError:
+  numba = None
+
+def _oscillator(freq, sample_rate, n_samples):
+  """Эталонные sin/cos частоты freq (векторно, через np.sin/np.cos)"""
+  w = 2 * np.pi * freq / sample_rate * np.arange(n_samples)
+  return np.sin(w), np.cos(w)
+
+if numba is not None:
+  @numba.njit(cache=True)
+  def _oscillator(freq, sample_rate, n_samples):
+      """
+      Эталонные sin/cos частоты freq без вызова sin для каждого сэмпла:
+      рекуррентный генератор (coupled-form) - 4 умножения и 2 сложения на сэмпл.
+      Без numba такой цикл медленнее np.sin, поэтому он есть только здесь
+      """
+      k = 2 * np.pi * freq / sample_rate
+      cs = np.cos(k)
+      sn = np.sin(k)
+      s = np.empty(n_samples)
+      c = np.empty(n_samples)
+      s[0] = 0.0
+      c[0] = 1.0
+      for n in range(n_samples - 1):
+          s[n + 1] = cs * s[n] + sn * c[n]
+          c[n + 1] = cs * c[n] - sn * s[n]
+      return s, c
+  
+  @numba.njit(cache=True, fastmath=True, parallel=True)
+  def _goertzel_batch(frames, coeff0, coeff1):
+      """Мощности двух частот в каждом кадре (алгоритм Гёрцеля, кадры параллельно)"""
+      n_bits, n_samples = frames.shape
+      power0 = np.empty(n_bits, dtype=np.float32)
+      power1 = np.empty(n_bits, dtype=np.float32)
+      for b in numba.prange(n_bits):
+          s0_prev = np.float32(0.0)
+          s0_prev2 = np.float32(0.0)
+          s1_prev = np.float32(0.0)
+          s1_prev2 = np.float32(0.0)
+          for n in range(n_samples):
+              x = frames[b, n]
+              s0 = x + coeff0 * s0_prev - s0_prev2
+              s0_prev2 = s0_prev
+              s0_prev = s0
+              s1 = x + coeff1 * s1_prev - s1_prev2
+              s1_prev2 = s1_prev
+              s1_prev = s1
+          power0[b] = s0_prev2 * s0_prev2 + s0_prev * s0_prev - coeff0 * s0_prev * s0_prev2
+          power1[b] = s1_prev2 * s1_prev2 + s1_prev * s1_prev - coeff1 * s1_prev * s1_prev2
+      return power0, power1
+else:
+  _goertzel_batch = None
+
+def _build_refs(samples_per_bit, sample_rate, freq_0, freq_1):
+  """Матрица эталонов [sin0, cos0, sin1, cos1] формы (samples_per_bit, 4)"""
+  ref_rate = _reference_rate(samples_per_bit, sample_rate)
+  refs = []
+  for freq in (freq_0, freq_1):
+      refs.extend(_oscillator(freq, ref_rate, samples_per_bit))
+  return np.stack(refs, axis=1).astype(np.float32)
+
+# Параметры по умолчанию (Bell 103, 8000 Гц / 300 бод) - самый частый случай,
+# поэтому таблицы строятся и ядро компилируется один раз при импорте
+_DEFAULT_REFS_KEY = (8000 // 300, 8000, 1070, 1270)
+_DEFAULT_REFS = _build_refs(*_DEFAULT_REFS_KEY)
+_DEFAULT_REFS.setflags(write=False)  # Общая для всех экземпляров DialupModem
+if _goertzel_batch is not None:
+  # Тот же тип, что дает read_wav для 16-битного файла (только для чтения)
+  _warmup_frames = np.zeros((1, _DEFAULT_REFS_KEY[0]), dtype='<i2')
+  _warmup_frames.setflags(write=False)
+  _goertzel_batch(_warmup_frames, np.float32(0), np.float32(0))
 
 class DialupModem:
+  # Заголовок пакета: маркер начала (4 байта) и длина данных (2 байта, little-endian)
+  START_MARKER = b'\xAA\x55\xAA\x55'  # Легко различимый паттерн
+  LENGTH_FORMAT = '<H'
+  
   def __init__(self, sample_rate=8000, baud_rate=300):
       """
       Инициализация параметров модема
@@ -23,38 +108,31 @@ class DialupModem:
       
       self.debug_mode = False  # Режим отладки
       
+      # Кэш эталонных таблиц: (samples_per_bit, sample_rate, freq_0, freq_1) -> матрица
+      self._ref = {_DEFAULT_REFS_KEY: _DEFAULT_REFS}
+      
   def text_to_bits(self, text):
       """Преобразование текста в биты с поддержкой UTF-8"""
-      bits = []
-      
       # Преобразуем текст в байты UTF-8
       try:
           text_bytes = text.encode('utf-8')
       except UnicodeEncodeError:
           print("❌ Ошибка кодирования текста в UTF-8")
-          return []
+          return np.zeros(0, dtype=np.uint8)
       
       if self.debug_mode:
           print(f"🔍 Текст в байтах UTF-8: {list(text_bytes)}")
       
-      # Добавляем маркер начала (4 байта)
-      start_marker = b'\xAA\x55\xAA\x55'  # Легко различимый паттерн
-      
-      # Добавляем длину данных (2 байта, little-endian)
+      # Формируем полный пакет данных: маркер начала, длина, данные
       data_length = len(text_bytes)
-      length_bytes = data_length.to_bytes(2, 'little')
-      
-      # Формируем полный пакет данных
-      full_data = start_marker + length_bytes + text_bytes
+      full_data = self.START_MARKER + struct.pack(self.LENGTH_FORMAT, data_length) + text_bytes
       
       if self.debug_mode:
           print(f"🔍 Полный пакет: {list(full_data)}")
           print(f"🔍 Длина данных: {data_length} байт")
       
       # Преобразуем каждый байт в биты (старший бит первый)
-      for byte_val in full_data:
-          for i in range(7, -1, -1):  # От старшего к младшему биту
-              bits.append((byte_val >> i) & 1)
+      bits = np.unpackbits(np.frombuffer(full_data, dtype=np.uint8))
       
       return bits
   
@@ -65,43 +143,35 @@ class DialupModem:
               print("❌ Недостаточно битов для декодирования")
           return ""
       
-      # Преобразуем биты в байты
-      bytes_data = []
-      for i in range(0, len(bits) - 7, 8):
-          if i + 8 <= len(bits):
-              byte_val = 0
-              for j in range(8):
-                  byte_val = (byte_val << 1) | bits[i + j]
-              bytes_data.append(byte_val)
+      # Преобразуем биты в байты (лишние биты в конце отбрасываем)
+      bits = np.asarray(bits, dtype=np.uint8)
+      bits = bits[:len(bits) - len(bits) % 8]
+      bytes_data = np.packbits(bits).tobytes()
       
       if self.debug_mode:
-          print(f"🔍 Декодированные байты: {bytes_data[:20]}..." if len(bytes_data) > 20 else f"🔍 Декодированные байты: {bytes_data}")
+          print(f"🔍 Декодированные байты: {list(bytes_data[:20])}..." if len(bytes_data) > 20 else f"🔍 Декодированные байты: {list(bytes_data)}")
       
       # Ищем маркер начала
-      start_marker = [0xAA, 0x55, 0xAA, 0x55]
-      start_pos = -1
-      
-      for i in range(len(bytes_data) - 3):
-          if bytes_data[i:i+4] == start_marker:
-              start_pos = i + 4
-              break
+      marker_pos = bytes_data.find(self.START_MARKER)
       
-      if start_pos == -1:
+      if marker_pos == -1:
           if self.debug_mode:
               print("❌ Маркер начала не найден")
           return ""
       
-      if start_pos + 2 >= len(bytes_data):
+      start_pos = marker_pos + len(self.START_MARKER)
+      length_size = struct.calcsize(self.LENGTH_FORMAT)
+      if start_pos + length_size > len(bytes_data):
           if self.debug_mode:
               print("❌ Недостаточно данных после маркера")
           return ""
       
       # Читаем длину данных
-      data_length = bytes_data[start_pos] + (bytes_data[start_pos + 1] << 8)
-      data_start = start_pos + 2
+      (data_length,) = struct.unpack_from(self.LENGTH_FORMAT, bytes_data, start_pos)
+      data_start = start_pos + length_size
       
       if self.debug_mode:
-          print(f"🔍 Найден маркер на позиции {start_pos - 4}")
+          print(f"🔍 Найден маркер на позиции {marker_pos}")
           print(f"🔍 Длина данных: {data_length} байт")
       
       if data_start + data_length > len(bytes_data):
@@ -111,7 +181,7 @@ class DialupModem:
           data_length = len(bytes_data) - data_start
       
       # Извлекаем данные
-      text_bytes = bytes(bytes_data[data_start:data_start + data_length])
+      text_bytes = bytes_data[data_start:data_start + data_length]
       
       if self.debug_mode:
           print(f"🔍 Извлеченные байты: {list(text_bytes)}")
@@ -131,7 +201,7 @@ class DialupModem:
       
       # Преобразуем текст в биты
       bits = self.text_to_bits(text)
-      if not bits:
+      if len(bits) == 0:
           print("❌ Ошибка преобразования текста в биты")
           return False
           
@@ -140,52 +210,96 @@ class DialupModem:
       if self.debug_mode:
           print(f"🔍 Первые биты: {bits[:32]}..." if len(bits) > 32 else f"🔍 Все биты: {bits}")
       
-      # Создаем звуковой сигнал
-      audio_data = []
-      
-      # Добавляем небольшую тишину в начале
+      # Частота для каждого сэмпла сигнала
+      samples_per_bit = int(self.bit_duration)
+      freqs = np.where(bits == 1, self.freq_1, self.freq_0)
+      per_sample_freq = np.repeat(freqs, samples_per_bit)
+      
+      # Интегрируем частоту в фазу - сигнал без разрывов фазы между битами.
+      # Шаг времени тот же, что у эталонов декодера (см. _reference_rate):
+      # f / ref_rate = f * N / (sample_rate * (N - 1)). Сумма считается в целых
+      # числах по модулю периода, поэтому фаза остается точной и в float32
+      # даже для длинных сообщений
+      period = self.sample_rate * (samples_per_bit - 1)
+      cycles = np.cumsum(per_sample_freq * samples_per_bit) % period
+      phase = cycles.astype(np.float32) * np.float32(2 * np.pi / period)
+      
+      # Выходной буфер: тишина в начале и в конце, сигнал пишется прямо в середину
       silence_duration = int(0.1 * self.sample_rate)
-      audio_data.extend(np.zeros(silence_duration))
-      
-      # Кодируем каждый бит
-      for i, bit in enumerate(bits):
-          freq = self.freq_1 if bit == 1 else self.freq_0
-          
-          # Создаем синусоиду для данного бита
-          t = np.linspace(0, 1/self.baud_rate, int(self.bit_duration))
-          bit_signal = 0.8 * np.sin(2 * np.pi * freq * t)  # Амплитуда 0.8
-          
-          audio_data.extend(bit_signal)
-          
-          # Показываем прогресс
-          if (i + 1) % 50 == 0 or i == len(bits) - 1:
-              progress = (i + 1) / len(bits) * 100
-              print(f"⏳ Прогресс кодирования: {progress:.1f}%")
+      tone_length = len(bits) * samples_per_bit
+      audio_data = np.empty(2 * silence_duration + tone_length, dtype=np.float32)
+      audio_data[:silence_duration] = 0
+      audio_data[silence_duration + tone_length:] = 0
       
-      # Добавляем тишину в конце
-      audio_data.extend(np.zeros(silence_duration))
+      tone = audio_data[silence_duration:silence_duration + tone_length]
+      np.sin(phase, out=tone)
+      tone *= np.float32(0.8)  # Амплитуда 0.8
       
-      # Преобразуем в numpy array
-      audio_data = np.array(audio_data)
+      print(f"📊 Сгенерировано сэмплов: {tone_length}")
       
-      # Сохраняем в WAV файл
-      write(output_file, self.sample_rate, (audio_data * 32767).astype(np.int16))
+      # Сохраняем в WAV файл (масштаб пишется сразу в int16, без временного массива)
+      pcm = np.empty(len(audio_data), dtype=np.int16)
+      np.multiply(audio_data, np.float32(32767), out=pcm, casting='unsafe')
+      write(output_file, self.sample_rate, pcm)
       print(f"✅ Аудио файл сохранен: {output_file}")
       print(f"🕒 Длительность: {len(audio_data) / self.sample_rate:.2f} секунд")
       return True
   
-  def correlate_with_frequency(self, signal, freq, sample_rate):
-      """Корреляция сигнала с эталонной частотой"""
-      t = np.linspace(0, len(signal) / sample_rate, len(signal))
-      reference_sin = np.sin(2 * np.pi * freq * t)
-      reference_cos = np.cos(2 * np.pi * freq * t)
-      
-      # Вычисляем корреляцию
-      corr_sin = np.sum(signal * reference_sin)
-      corr_cos = np.sum(signal * reference_cos)
+  def _get_refs(self, samples_per_bit, sample_rate):
+      """Эталонные синусы/косинусы обеих частот (строятся один раз)"""
+      key = (samples_per_bit, sample_rate, self.freq_0, self.freq_1)
+      if key not in self._ref:
+          self._ref[key] = _build_refs(*key)
+      return self._ref[key]
+  
+  def tone_powers(self, frames, sample_rate):
+      """
+      Мощность обеих частот в каждом кадре
+      frames: массив формы (n_bits, samples_per_bit), int16 или float32
+      """
+      # С numba - скомпилированный алгоритм Гёрцеля, int16 читается напрямую.
+      # Длинные кадры (высокая частота дискретизации / низкая скорость)
+      # быстрее считает BLAS
+      if _goertzel_batch is not None and frames.shape[1] <= 128:
+          ref_rate = _reference_rate(frames.shape[1], sample_rate)
+          coeff0 = np.float32(2 * np.cos(2 * np.pi * self.freq_0 / ref_rate))
+          coeff1 = np.float32(2 * np.cos(2 * np.pi * self.freq_1 / ref_rate))
+          return _goertzel_batch(np.ascontiguousarray(frames), coeff0, coeff1)
+      
+      # Иначе - одно матричное умножение вместо корреляции кадров по отдельности.
+      # Целочисленное умножение матриц в numpy идет мимо BLAS и медленнее,
+      # поэтому int16 кадры переводим в float32
+      refs = self._get_refs(frames.shape[1], sample_rate)
+      # Пары столбцов [sin, cos] - мнимая и действительная части комплексной
+      # корреляции с exp(-j*w*t), поэтому мощность - сумма квадратов пары
+      c = frames.astype(np.float32, copy=False) @ refs
+      powers = np.square(c, out=c).reshape(-1, 2, 2).sum(axis=2)
+      return powers[:, 0], powers[:, 1]
+  
+  def read_wav(self, input_file):
+      """
+      Чтение WAV файла без лишних копий: PCM данные используются
+      напрямую через np.frombuffer, берется только первый канал
+      """
+      try:
+          with wave.open(input_file, 'rb') as wf:
+              sample_rate = wf.getframerate()
+              sample_width = wf.getsampwidth()
+              n_channels = wf.getnchannels()
+              raw = wf.readframes(wf.getnframes())
+      except wave.Error:
+          sample_width = None
+      
+      dtype = {2: '<i2', 4: '<i4'}.get(sample_width)
+      if dtype is None:
+          # Не PCM (например, float WAV) или 8/24 бит - читаем через scipy
+          sample_rate, audio_data = read(input_file)
+          if audio_data.ndim > 1:
+              audio_data = audio_data[:, 0]
+          return sample_rate, audio_data
       
-      # Возвращаем мощность (квадрат амплитуды)
-      return corr_sin**2 + corr_cos**2
+      audio_data = np.frombuffer(raw, dtype=dtype)[::n_channels]
+      return sample_rate, audio_data
   
   def decode_from_audio(self, input_file):
       """Декодирование звукового файла в текст"""
@@ -198,15 +312,23 @@ class DialupModem:
               return ""
           
           # Читаем WAV файл
-          sample_rate, audio_data = read(input_file)
+          sample_rate, audio_data = self.read_wav(input_file)
           
-          # Нормализуем данные
+          # Нормализуем данные. 16-битный сигнал оставляем целым: бит
+          # определяется сравнением мощностей, а оно не зависит от масштаба
+          full_scale = 1.0
           if audio_data.dtype == np.int16:
-              audio_data = audio_data.astype(np.float32) / 32767.0
+              full_scale = 32767.0
           elif audio_data.dtype == np.int32:
-              audio_data = audio_data.astype(np.float32) / 2147483647.0
+              # Приведение и масштаб за один проход, без промежуточной копии
+              audio_data = np.multiply(audio_data, np.float32(1 / 2147483647.0), dtype=np.float32)
           else:
-              audio_data = audio_data.astype(np.float32)
+              audio_data = audio_data.astype(np.float32, copy=False)
+          
+          # Детектор работает только с int16 или float32 - без незаметного перехода на float64
+          if audio_data.dtype not in (np.int16, np.float32):
+              print(f"❌ Неподдерживаемый тип сэмплов после нормализации: {audio_data.dtype}")
+              return ""
           
           print(f"📊 Длительность файла: {len(audio_data) / sample_rate:.2f} секунд")
           print(f"📊 Частота дискретизации: {sample_rate} Гц")
@@ -218,47 +340,30 @@ class DialupModem:
           print(f"🔍 Сэмплов на бит: {samples_per_bit}")
           
           # Убираем тишину в начале
-          threshold = 0.01
-          start_idx = 0
-          for i in range(len(audio_data)):
-              if abs(audio_data[i]) > threshold:
-                  start_idx = max(0, i - samples_per_bit//4)  # Небольшой отступ назад
-                  break
+          threshold = 0.01 * full_scale
+          mask = np.abs(audio_data) > threshold
+          start_idx = int(np.argmax(mask)) if mask.any() else 0
+          start_idx = max(0, start_idx - samples_per_bit//4)  # Небольшой отступ назад
           
           audio_data = audio_data[start_idx:]
           print(f"🔍 Начало сигнала на позиции: {start_idx / sample_rate:.3f} сек")
           
-          # Декодируем биты
-          bits = []
-          total_samples = len(audio_data)
+          # Нарезаем сигнал на кадры по одному биту
+          n_bits = len(audio_data) // samples_per_bit
+          frames = audio_data[:n_bits * samples_per_bit].reshape(n_bits, samples_per_bit)
           
           print(f"🔍 Начинаем декодирование битов...")
           
-          for i in range(0, total_samples - samples_per_bit, samples_per_bit):
-              # Извлекаем сегмент для одного бита
-              segment = audio_data[i:i + samples_per_bit]
-              
-              if len(segment) < samples_per_bit:
-                  break
-              
-              # Используем корреляционный метод для определения частоты
-              power_0 = self.correlate_with_frequency(segment, self.freq_0, sample_rate)
-              power_1 = self.correlate_with_frequency(segment, self.freq_1, sample_rate)
-              
-              # Определяем бит по большей мощности
-              if power_1 > power_0:
-                  bits.append(1)
-                  if self.debug_mode and len(bits) <= 20:
-                      print(f"Бит {len(bits)}: 1 (P0={power_0:.2f}, P1={power_1:.2f})")
-              else:
-                  bits.append(0)
-                  if self.debug_mode and len(bits) <= 20:
-                      print(f"Бит {len(bits)}: 0 (P0={power_0:.2f}, P1={power_1:.2f})")
-              
-              # Показываем прогресс
-              if len(bits) % 50 == 0:
-                  progress = i / total_samples * 100
-                  print(f"⏳ Прогресс декодирования: {min(progress, 100):.1f}%")
+          # Определяем бит по большей мощности
+          power_0, power_1 = self.tone_powers(frames, sample_rate)
+          bits = np.empty(n_bits, dtype=np.uint8)
+          np.greater(power_1, power_0, out=bits)
+          
+          if self.debug_mode:
+              # Мощности в нормализованной шкале, как для сигнала в диапазоне [-1, 1]
+              power_scale = full_scale ** 2
+              for i in range(min(n_bits, 20)):
+                  print(f"Бит {i + 1}: {bits[i]} (P0={power_0[i] / power_scale:.2f}, P1={power_1[i] / power_scale:.2f})")
           
           print(f"📊 Декодировано битов: {len(bits)}")
           